@@ -0,0 +1,158 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, case, cast, select, union_all, Integer
+
+# How many months after signup the cohort matrix tracks
+COHORT_PERIODS = 6
+# Days after expiry a new payment still counts as a renewal
+RENEWAL_GRACE_DAYS = 7
+
+
+def month_index(column):
+    """
+    SQL expression turning a timestamp into a running month number
+    (year * 12 + month - 1) so "next month" is just +1.
+    """
+    return (
+        cast(func.strftime('%Y', column), Integer) * 12
+        + cast(func.strftime('%m', column), Integer) - 1
+    )
+
+
+def month_label(index):
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def normalized_phone(column):
+    """
+    SQL version of provisioning.normalize_phone, so users (stored as typed)
+    join to payments (stored as 2547XXXXXXXX).
+    """
+    return case(
+        (column.like('0%'), '254' + func.substr(column, 2)),
+        (column.like('+%'), func.substr(column, 2)),
+        else_=column,
+    )
+
+
+def _completed_payments(payment_models):
+    """
+    Completed payments as a (phone, timestamp, expiry_date) subquery,
+    across every table given (live payments and the archive).
+    """
+    selects = [
+        select(
+            normalized_phone(model.phone).label('phone'),
+            model.timestamp.label('timestamp'),
+            model.expiry_date.label('expiry_date'),
+        ).where(model.status == 'Completed')
+        for model in payment_models
+    ]
+    if len(selects) == 1:
+        return selects[0].subquery()
+    return union_all(*selects).subquery()
+
+
+def _paying_months(payment_models):
+    """Distinct (phone, month) pairs with at least one completed payment."""
+    payments = _completed_payments(payment_models)
+    return (
+        select(payments.c.phone, month_index(payments.c.timestamp).label('month'))
+        .distinct()
+        .subquery()
+    )
+
+
+def compute_cohorts(session, User, *payment_models, periods=COHORT_PERIODS):
+    """
+    Monthly signup cohorts vs. paying subscribers.
+
+    Returns a list of {"cohort", "size", "retained": [n0, n1, ...]} where
+    retained[k] counts cohort members who paid in the k-th month after
+    signing up. Payments are read from every model in `payment_models`.
+    Two grouped queries, no per-user work in Python.
+    """
+    cohort_month = month_index(User.created_at)
+    sizes = dict(
+        session.query(cohort_month, func.count(User.id))
+        .filter(User.created_at.isnot(None))
+        .group_by(cohort_month)
+        .all()
+    )
+
+    users = (
+        session.query(
+            normalized_phone(User.phone).label('phone'),
+            cohort_month.label('cohort'),
+        )
+        .filter(User.created_at.isnot(None))
+        .subquery()
+    )
+    paying = _paying_months(payment_models)
+    period = (paying.c.month - users.c.cohort).label('period')
+
+    retained = (
+        session.query(users.c.cohort, period, func.count())
+        .join(paying, paying.c.phone == users.c.phone)
+        .filter(period >= 0, period < periods)
+        .group_by(users.c.cohort, period)
+        .all()
+    )
+
+    matrix = {cohort: [0] * periods for cohort in sizes}
+    for cohort, offset, count in retained:
+        matrix[cohort][offset] = count
+
+    return [
+        {"cohort": month_label(cohort), "size": sizes[cohort], "retained": matrix[cohort]}
+        for cohort in sorted(sizes)
+    ]
+
+
+def compute_renewals(session, *payment_models, grace_days=RENEWAL_GRACE_DAYS, now=None):
+    """
+    Renewal and churn by the month subscriptions came due.
+
+    A completed payment counts as renewed when the same phone pays again
+    after it and no later than `grace_days` past its expiry_date, so 30-day
+    cycles that straddle calendar months aren't counted as churn. Only
+    subscriptions whose grace window has closed are reported.
+    """
+    now = now or datetime.utcnow()
+    payments = _completed_payments(payment_models)
+
+    # One ordered pass: each payment next to the same phone's following one
+    paid = select(
+        payments.c.expiry_date,
+        func.lead(payments.c.timestamp).over(
+            partition_by=payments.c.phone,
+            order_by=payments.c.timestamp,
+        ).label('next_paid_at'),
+    ).subquery()
+    due_month = month_index(paid.c.expiry_date)
+    renewed = paid.c.next_paid_at <= func.datetime(paid.c.expiry_date, f'+{grace_days} days')
+
+    rows = (
+        session.query(
+            due_month,
+            func.count(),
+            func.sum(case((renewed, 1), else_=0)),
+        )
+        .filter(paid.c.expiry_date.isnot(None),
+                paid.c.expiry_date < now - timedelta(days=grace_days))
+        .group_by(due_month)
+        .order_by(due_month)
+        .all()
+    )
+
+    results = []
+    for month, due, renewed_count in rows:
+        renewal_rate = round(renewed_count / due * 100, 2) if due else 0
+        results.append({
+            "month": month_label(month),
+            "active": due,
+            "renewed": renewed_count,
+            "renewal_rate": renewal_rate,
+            "churn_rate": round(100 - renewal_rate, 2) if due else 0,
+        })
+    return results
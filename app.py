@@ -6,11 +6,18 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
 from mpesa_utils import get_access_token, initiate_stk_push
+from provisioning import desired_secrets, sync_secrets, normalize_phone
+from analytics import compute_cohorts, compute_renewals, RENEWAL_GRACE_DAYS
+from scheduler import Scheduler
 from routeros_api import RouterOsApiPool
-from sqlalchemy import func, text
+from sqlalchemy import event, func, text
+from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime, timedelta
+import queue
+import threading
 import time
 import os
+import click
 from dotenv import load_dotenv
 
 # -----------------------------
@@ -29,6 +36,14 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
+# SQLite: WAL lets long reads (the analytics refresh in `flask run-scheduler`)
+# run alongside writes like /callback instead of locking them out
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith("sqlite"):
+    with app.app_context():
+        @event.listens_for(db.engine, "connect")
+        def _sqlite_wal(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
 # MPESA credentials from .env
 consumer_key = os.environ.get("MPESA_CONSUMER_KEY")
 consumer_secret = os.environ.get("MPESA_CONSUMER_SECRET")
@@ -36,6 +51,21 @@ passkey = os.environ.get("MPESA_PASSKEY")
 business_short_code = os.environ.get("MPESA_SHORTCODE")
 callback_url = os.environ.get("MPESA_CALLBACK_URL")
 
+# MikroTik credentials from .env
+mikrotik_host = os.environ.get("MIKROTIK_HOST", "10.10.0.1")
+mikrotik_port = int(os.environ.get("MIKROTIK_PORT", 8728))
+mikrotik_username = os.environ.get("MIKROTIK_USERNAME", "admin")
+mikrotik_password = os.environ.get("MIKROTIK_PASSWORD", "TheLion")
+mikrotik_timeout = float(os.environ.get("MIKROTIK_TIMEOUT", 5))
+# Password for PPP secrets created by the provisioning sync (unset = don't create)
+pppoe_default_password = os.environ.get("PPPOE_DEFAULT_PASSWORD")
+
+# Maintenance jobs
+pending_timeout_minutes = int(os.environ.get("PENDING_TIMEOUT_MINUTES", 30))
+# How long after expiry a late Daraja callback may still complete a payment
+late_callback_hours = int(os.environ.get("LATE_CALLBACK_HOURS", 24))
+payment_archive_days = int(os.environ.get("PAYMENT_ARCHIVE_DAYS", 365))
+
 # -----------------------------
 # Models
 # -----------------------------
@@ -63,17 +93,75 @@ class Payment(db.Model):
     expiry_date = db.Column(db.DateTime)
     account_name = db.Column(db.String(100))
 
+    # Callback matching and analytics both look payments up by phone + status
+    __table_args__ = (db.Index('ix_payment_phone_status', 'phone', 'status'),)
+
 
 class Package(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     amount = db.Column(db.Integer, nullable=False)
 
+
+# Payments older than payment_archive_days, moved out by the archive job
+class PaymentArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    phone = db.Column(db.String(20), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    package = db.Column(db.String(100))
+    timestamp = db.Column(db.DateTime)
+    expiry_date = db.Column(db.DateTime)
+    account_name = db.Column(db.String(100))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Scheduler lock/next-run per job, and the history of every run
+class JobState(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    last_run_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+
+
+class JobRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False, index=True)
+    owner = db.Column(db.String(100))
+    status = db.Column(db.String(20), nullable=False)
+    detail = db.Column(db.String(500))
+    started_at = db.Column(db.DateTime, nullable=False, index=True)
+    duration_ms = db.Column(db.Integer)
+
+
+# Materialised analytics, rebuilt by refresh_analytics()
+class CohortStat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cohort = db.Column(db.String(7), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    period = db.Column(db.Integer, nullable=False)
+    retained = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class RenewalStat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)
+    active = db.Column(db.Integer, nullable=False)
+    renewed = db.Column(db.Integer, nullable=False)
+    renewal_rate = db.Column(db.Float, nullable=False)
+    churn_rate = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 # -----------------------------
 # DB create + seed
 # -----------------------------
 with app.app_context():
     db.create_all()
+    # create_all skips tables that already exist, so add new indexes explicitly
+    for index in Payment.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
 
     if Package.query.count() == 0:
         default_packages = [
@@ -95,7 +183,312 @@ with app.app_context():
 # -----------------------------
 # MikroTik cache
 # -----------------------------
-mikrotik_cache = {"timestamp": 0, "pppoe": 0}
+mikrotik_cache = {"timestamp": 0, "pppoe": 0, "error": None}
+mikrotik_cache_lock = threading.Lock()
+
+
+def get_mikrotik_pool():
+    api_pool = RouterOsApiPool(mikrotik_host, mikrotik_username, mikrotik_password,
+                               port=mikrotik_port, plaintext_login=True)
+    api_pool.set_timeout(mikrotik_timeout)
+    return api_pool
+
+
+def refresh_mikrotik_cache():
+    """Fetch the active PPPoE count into mikrotik_cache."""
+    api_pool = get_mikrotik_pool()
+    try:
+        api = api_pool.get_api()
+        pppoe_active = api.get_resource('/ppp/active').get()
+        mikrotik_cache["pppoe"] = len(pppoe_active)
+        mikrotik_cache["error"] = None
+    except Exception as e:
+        mikrotik_cache["error"] = str(e)
+    finally:
+        api_pool.disconnect()
+        mikrotik_cache["timestamp"] = time.time()
+        mikrotik_cache_lock.release()
+
+
+def refresh_mikrotik_cache_async(max_age=30):
+    """
+    Refresh the cache in a background thread when it is older than
+    `max_age` seconds. Only one refresh runs at a time; callers never wait.
+    """
+    if time.time() - mikrotik_cache["timestamp"] <= max_age:
+        return
+    if mikrotik_cache_lock.acquire(blocking=False):
+        threading.Thread(target=refresh_mikrotik_cache, daemon=True).start()
+
+# -----------------------------
+# PPP secret provisioning
+# -----------------------------
+def subscription_rows(phones=None):
+    """
+    Latest completed payment per phone, as
+    (phone, package, amount, expiry_date, account_name) rows.
+    """
+    latest = (
+        db.session.query(
+            Payment.phone.label('phone'),
+            func.max(Payment.expiry_date).label('expiry_date')
+        )
+        .filter(Payment.status == 'Completed')
+        .group_by(Payment.phone)
+    )
+    if phones is not None:
+        latest = latest.filter(Payment.phone.in_(phones))
+    latest = latest.subquery()
+
+    return (
+        db.session.query(
+            Payment.phone, Payment.package, Payment.amount,
+            Payment.expiry_date, Payment.account_name
+        )
+        .join(latest, (Payment.phone == latest.c.phone) &
+              (Payment.expiry_date == latest.c.expiry_date))
+        .filter(Payment.status == 'Completed')
+        .all()
+    )
+
+
+def provision_subscribers(phones=None):
+    """
+    Push paid/expired state to /ppp/secret. Pass `phones` for an
+    incremental sync of just those subscribers; omit for a full sync.
+    """
+    if phones is not None:
+        phones = list({normalize_phone(p) for p in phones})
+    package_names_by_amount = {p.amount: p.name for p in Package.query.all()}
+    desired = desired_secrets(subscription_rows(phones), package_names_by_amount)
+
+    api_pool = get_mikrotik_pool()
+    try:
+        api = api_pool.get_api()
+        return sync_secrets(api, desired, pppoe_default_password,
+                            names=None if phones is None else list(desired))
+    finally:
+        api_pool.disconnect()
+
+
+# Phones waiting for an incremental sync, drained by one thread per process.
+# Bounded so a long router outage can't grow it without limit.
+provision_queue = queue.Queue(maxsize=1000)
+provision_worker = {"thread": None}
+provision_worker_lock = threading.Lock()
+PROVISION_RETRY_SECONDS = 30
+
+
+def _queue_phone(phone):
+    try:
+        provision_queue.put_nowait(phone)
+    except queue.Full:
+        # The periodic full sync will still pick this subscriber up
+        print("⚠️ Provisioning queue full, leaving", phone, "to the full sync")
+
+
+def _provision_worker():
+    while True:
+        phones = {provision_queue.get()}
+        # Fold everything that piled up meanwhile into the same sync
+        while True:
+            try:
+                phones.add(provision_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        with app.app_context():
+            try:
+                print("🔄 PPP sync:", provision_subscribers(sorted(phones)))
+                continue
+            except Exception as e:
+                print(f"⚠️ PPP sync failed, retrying in {PROVISION_RETRY_SECONDS}s:", e)
+        time.sleep(PROVISION_RETRY_SECONDS)
+        for phone in phones:
+            _queue_phone(phone)
+
+
+def enqueue_provisioning(phones):
+    """
+    Queue an incremental sync off the request thread. A single worker
+    thread per process batches queued phones over one router connection;
+    anything lost to a worker restart is picked up by the periodic full sync.
+    """
+    for phone in phones:
+        _queue_phone(phone)
+    with provision_worker_lock:
+        thread = provision_worker["thread"]
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_provision_worker, daemon=True)
+            provision_worker["thread"] = thread
+            thread.start()
+
+
+# -----------------------------
+# Cohort analytics
+# -----------------------------
+def refresh_analytics():
+    """
+    Recompute cohort retention and renewal stats and replace the
+    materialised rows in one transaction.
+    """
+    computed_at = datetime.utcnow()
+    # Archived payments still count towards history
+    cohorts = compute_cohorts(db.session, User, Payment, PaymentArchive)
+    renewals = compute_renewals(db.session, Payment, PaymentArchive)
+
+    CohortStat.query.delete()
+    RenewalStat.query.delete()
+    db.session.bulk_insert_mappings(CohortStat, [
+        {"cohort": c["cohort"], "size": c["size"], "period": period,
+         "retained": retained, "computed_at": computed_at}
+        for c in cohorts
+        for period, retained in enumerate(c["retained"])
+    ])
+    db.session.bulk_insert_mappings(RenewalStat, [
+        dict(r, computed_at=computed_at) for r in renewals
+    ])
+    db.session.commit()
+    return len(cohorts), len(renewals)
+
+
+def load_cohorts(limit=6):
+    """
+    Latest `limit` cohorts as {"cohort", "size", "rates": [% per period]}.
+    Periods that haven't happened yet are None rather than 0%.
+    """
+    now = datetime.utcnow()
+    this_month = now.year * 12 + now.month - 1
+    recent = [c for (c,) in db.session.query(CohortStat.cohort).distinct()
+              .order_by(CohortStat.cohort.desc()).limit(limit)]
+    rows = (
+        CohortStat.query.filter(CohortStat.cohort.in_(recent))
+        .order_by(CohortStat.cohort, CohortStat.period).all()
+    )
+    cohorts = {}
+    for row in rows:
+        entry = cohorts.setdefault(row.cohort, {"cohort": row.cohort, "size": row.size, "rates": []})
+        year, month = map(int, row.cohort.split('-'))
+        if year * 12 + month - 1 + row.period >= this_month:
+            entry["rates"].append(None)
+        else:
+            entry["rates"].append(round(row.retained / row.size * 100, 1) if row.size else 0)
+    return list(cohorts.values())
+
+
+# -----------------------------
+# Scheduled maintenance
+# -----------------------------
+scheduler = Scheduler(app, db, JobState, JobRun)
+
+
+@scheduler.job('expire-pending-payments', every=300)
+def expire_pending_payments(batch_size=1000):
+    """
+    Mark STK pushes nobody completed as Expired, a batch at a time.
+    /callback still completes Expired rows up to late_callback_hours old.
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=pending_timeout_minutes)
+    expired = 0
+    while True:
+        ids = [i for (i,) in db.session.query(Payment.id)
+               .filter(Payment.status == 'Pending', Payment.timestamp < cutoff)
+               .limit(batch_size)]
+        if not ids:
+            return expired
+        Payment.query.filter(Payment.id.in_(ids)) \
+            .update({"status": "Expired"}, synchronize_session=False)
+        db.session.commit()
+        expired += len(ids)
+
+
+@scheduler.job('archive-old-payments', every=24 * 3600, timeout=3600)
+def archive_old_payments(batch_size=1000):
+    """Move payments older than payment_archive_days into PaymentArchive."""
+    cutoff = datetime.utcnow() - timedelta(days=payment_archive_days)
+    columns = ['id', 'phone', 'amount', 'status', 'package',
+               'timestamp', 'expiry_date', 'account_name']
+    archived = 0
+    while True:
+        rows = (
+            db.session.query(*[getattr(Payment, c) for c in columns])
+            .filter(Payment.timestamp < cutoff, Payment.status != 'Pending')
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return archived
+        now = datetime.utcnow()
+        db.session.bulk_insert_mappings(PaymentArchive, [
+            dict(zip(columns, row), archived_at=now) for row in rows
+        ])
+        Payment.query.filter(Payment.id.in_([row.id for row in rows])) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        archived += len(rows)
+
+
+@scheduler.job('sync-ppp-secrets', every=900)
+def sync_ppp_secrets_job():
+    """Full PPP sync, so subscriptions are disabled once they expire."""
+    return provision_subscribers()
+
+
+@scheduler.job('refresh-analytics', every=3600, timeout=1800)
+def refresh_analytics_job():
+    return refresh_analytics()
+
+
+@scheduler.job('prune-job-history', every=24 * 3600)
+def prune_job_history(days=30):
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    pruned = JobRun.query.filter(JobRun.started_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return pruned
+
+
+# mikrotik_cache is per process, so every gunicorn worker warms its own
+# copy; `flask run-scheduler` serves no requests and skips local jobs
+@scheduler.job('warm-mikrotik-cache', every=30, exclusive=False)
+def warm_mikrotik_cache():
+    if mikrotik_cache_lock.acquire(blocking=False):
+        refresh_mikrotik_cache()
+    return mikrotik_cache["error"] or mikrotik_cache["pppoe"]
+
+
+@app.cli.command('run-scheduler')
+def run_scheduler_command():
+    """Run the maintenance scheduler in the foreground."""
+    print("⏱️ Scheduler running jobs:", ", ".join(scheduler.jobs))
+    scheduler.run_forever(local_jobs=False)
+
+
+@app.cli.command('run-job')
+@click.argument('name')
+def run_job_command(name):
+    """Run one scheduled job now, ignoring its schedule."""
+    if name not in scheduler.jobs:
+        print("❌ Unknown job. Choose from:", ", ".join(scheduler.jobs))
+        return
+    status = scheduler.run_job(name, force=True)
+    print(f"Job {name}:", status or "skipped (another process holds the lock)")
+
+
+@app.cli.command('refresh-analytics')
+def refresh_analytics_command():
+    """Rebuild cohort retention and churn tables (run from cron)."""
+    started = time.time()
+    cohorts, months = refresh_analytics()
+    print(f"✅ Analytics refreshed in {time.time() - started:.2f}s: "
+          f"{cohorts} cohorts, {months} months")
+
+
+@app.cli.command('sync-ppp')
+def sync_ppp_command():
+    """Full sync of paid subscribers into MikroTik PPP secrets."""
+    started = time.time()
+    result = provision_subscribers()
+    print(f"✅ PPP sync done in {time.time() - started:.2f}s:", result)
 
 # -----------------------------
 # Public / Auth routes
@@ -255,11 +648,22 @@ def callback():
 
             payment = Payment.query.filter_by(phone=phone, amount=amount, status='Pending') \
                         .order_by(Payment.timestamp.desc()).first()
+            if not payment:
+                # The expiry job may have timed it out before Daraja called back
+                payment = Payment.query.filter(
+                    Payment.phone == phone, Payment.amount == amount,
+                    Payment.status == 'Expired',
+                    Payment.timestamp >= datetime.utcnow() - timedelta(hours=late_callback_hours)
+                ).order_by(Payment.timestamp.desc()).first()
             if payment:
                 payment.status = 'Completed'
                 payment.expiry_date = datetime.utcnow() + timedelta(days=30)
                 db.session.commit()
+                # Only a payment we initiated may change router state
+                enqueue_provisioning([phone])
             else:
+                # Unmatched (or forged) callback: record it for the admin,
+                # but don't touch the router
                 db.session.add(Payment(
                     phone=phone, amount=amount, status='Completed',
                     package=None, account_name=None,
@@ -267,6 +671,11 @@ def callback():
                     expiry_date=datetime.utcnow() + timedelta(days=30)
                 ))
                 db.session.commit()
+    except SQLAlchemyError as e:
+        # Not recorded: fail so Daraja retries instead of dropping the payment
+        db.session.rollback()
+        print("❌ Could not record callback:", e)
+        return jsonify({"ResultCode": 1, "ResultDesc": "Temporary error, retry"}), 500
     except Exception as e:
         print("❌ Error handling callback:", e)
     return jsonify({"ResultCode": 0, "ResultDesc": "Accepted"})
@@ -351,7 +760,10 @@ def admin_dashboard():
     # Totals
     user_count = User.query.count()
     package_count = Package.query.count()  # not currently shown, but passed if needed
-    total_payments = db.session.query(func.sum(Payment.amount)).scalar() or 0
+    total_payments = (
+        (db.session.query(func.sum(Payment.amount)).scalar() or 0)
+        + (db.session.query(func.sum(PaymentArchive.amount)).scalar() or 0)
+    )
 
     # Recent items
     recent_users = User.query.order_by(User.id.desc()).limit(5).all()
@@ -394,30 +806,25 @@ def admin_dashboard():
     # Retention (6 months)
     start_users = User.query.filter(User.created_at <= six_months_ago).count()
     new_users = User.query.filter(User.created_at > six_months_ago).count()
-    retained_user_ids = (
-        db.session.query(Payment.phone)
+    retained_users = (
+        db.session.query(func.count(func.distinct(Payment.phone)))
         .filter(Payment.timestamp >= six_months_ago, Payment.status == 'Completed')
-        .distinct()
-        .all()
+        .scalar()
     )
-    retained_users = len(retained_user_ids)
     retention_rate = 0
     if start_users > 0:
         retention_rate = round(((retained_users - new_users) / start_users) * 100, 2)
 
-    # MikroTik PPPoE active count (cached 30s)
-    pppoe_count = mikrotik_cache.get("pppoe", 0)
-    try:
-        if time.time() - mikrotik_cache.get("timestamp", 0) > 30:
-            api_pool = RouterOsApiPool('10.10.0.1', 'admin', 'TheLion', plaintext_login=True)
-            api = api_pool.get_api()
-            pppoe_active = api.get_resource('/ppp/active').get()
-            pppoe_count = len(pppoe_active)
-            mikrotik_cache["pppoe"] = pppoe_count
-            mikrotik_cache["timestamp"] = time.time()
-            api_pool.disconnect()
-    except Exception as e:
-        flash(f"⚠️ MikroTik connection failed: {e}", "admin-warning")
+    # Cohort retention + churn (precomputed by `flask refresh-analytics`)
+    cohorts = load_cohorts()
+    renewals = RenewalStat.query.order_by(RenewalStat.month.desc()).limit(6).all()[::-1]
+    analytics_updated = db.session.query(func.max(CohortStat.computed_at)).scalar()
+
+    # MikroTik PPPoE active count (refreshed in the background every 30s)
+    refresh_mikrotik_cache_async()
+    pppoe_count = mikrotik_cache["pppoe"]
+    if mikrotik_cache["error"]:
+        flash(f"⚠️ MikroTik connection failed: {mikrotik_cache['error']}", "admin-warning")
 
     return render_template(
         'admin/dashboard.html',
@@ -431,7 +838,11 @@ def admin_dashboard():
         daily_data=daily_data,
         monthly_labels=monthly_labels,
         monthly_data=monthly_data,
-        retention_rate=retention_rate
+        retention_rate=retention_rate,
+        cohorts=cohorts,
+        renewals=renewals,
+        analytics_updated=analytics_updated,
+        renewal_grace_days=RENEWAL_GRACE_DAYS
     )
 
 
@@ -537,7 +948,7 @@ def admin_usage():
 
     users = []
     try:
-        api_pool = RouterOsApiPool('10.10.0.1', 'admin', 'TheLion', plaintext_login=True)
+        api_pool = get_mikrotik_pool()
         api = api_pool.get_api()
         ppp_active = api.get_resource('/ppp/active')
         active_users = ppp_active.get()
@@ -588,7 +999,7 @@ def disconnect_pppoe_user(name):
         return redirect(url_for('admin_login'))
 
     try:
-        api_pool = RouterOsApiPool('10.10.0.1', 'admin', 'TheLion', plaintext_login=True)
+        api_pool = get_mikrotik_pool()
         api = api_pool.get_api()
         ppp_active = api.get_resource('/ppp/active')
 
@@ -604,6 +1015,43 @@ def disconnect_pppoe_user(name):
     return redirect(url_for('admin_usage'))
 
 
+# -----------------------------------------------------------------------------
+# Admin PPP secret sync
+# -----------------------------------------------------------------------------
+@app.route('/admin/provisioning/sync', methods=['POST'])
+def admin_sync_ppp():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    try:
+        result = provision_subscribers()
+        flash(f"✅ PPP sync: {result['added']} added, {result['updated']} updated, "
+              f"{result['skipped']} skipped, {len(result['errors'])} errors.", "admin-success")
+    except Exception as e:
+        flash("⚠️ PPP sync failed: " + str(e), "admin-danger")
+
+    return redirect(url_for('admin_dashboard'))
+
+
+# -----------------------------------------------------------------------------
+# Admin scheduled jobs
+# -----------------------------------------------------------------------------
+@app.route('/admin/jobs')
+def admin_jobs():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    states = {s.name: s for s in JobState.query.all()}
+    jobs = [{
+        "name": name,
+        "every": job["every"],
+        "exclusive": job["exclusive"],
+        "state": states.get(name),
+    } for name, job in scheduler.jobs.items()]
+    runs = JobRun.query.order_by(JobRun.started_at.desc()).limit(50).all()
+    return render_template('admin/jobs.html', jobs=jobs, runs=runs)
+
+
 # -----------------------------------------------------------------------------
 # Admin Payment Edit
 # -----------------------------------------------------------------------------
@@ -0,0 +1,226 @@
+"""
+Mixed-traffic load driver for a running portal.
+
+    python -m bench.load run --base-url http://127.0.0.1:8000 --users 10000
+    python -m bench.load compare bench/results/a.json bench/results/b.json
+
+Replays customer (browse + checkout), admin (dashboard + usage) and M-Pesa
+callback traffic from concurrent clients and reports throughput and
+p50/p95/p99 latency per route.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from bench.seed import BENCH_PASSWORD, seeded_phone, seeded_user_phone
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# (route label, weight) — roughly what a busy evening looks like
+TRAFFIC_MIX = [
+    ("GET /", 5),
+    ("GET /packages", 30),
+    ("POST /payment", 20),
+    ("POST /callback", 20),
+    ("GET /get_token", 5),
+    ("GET /admin/dashboard", 10),
+    ("GET /admin/usage", 10),
+]
+
+MIXES = {
+    "mixed": TRAFFIC_MIX,
+    # Customers hitting "Pay" only: DB insert + Daraja OAuth/STK round trips
+    "checkout": [("POST /payment", 1)],
+}
+
+
+def callback_payload(phone, amount):
+    return {"Body": {"stkCallback": {
+        "MerchantRequestID": "bench",
+        "CheckoutRequestID": "bench",
+        "ResultCode": 0,
+        "ResultDesc": "The service request is processed successfully.",
+        "CallbackMetadata": {"Item": [
+            {"Name": "Amount", "Value": amount},
+            {"Name": "MpesaReceiptNumber", "Value": "BENCH"},
+            {"Name": "PhoneNumber", "Value": int(phone)},
+        ]},
+    }}}
+
+
+class Client:
+    """One simulated browser with a customer and an admin session."""
+
+    def __init__(self, base_url, users, rng):
+        self.base_url = base_url.rstrip("/")
+        self.rng = rng
+        index = rng.randrange(users)
+        self.phone = seeded_phone(index)
+        self.customer = requests.Session()
+        self.admin = requests.Session()
+        # Log in with the phone exactly as stored, or /payment just redirects
+        self.customer.post(f"{self.base_url}/login",
+                           data={"phone": seeded_user_phone(index), "password": BENCH_PASSWORD})
+        self.admin.post(f"{self.base_url}/admin-login",
+                        data={"username": "admin", "password": "admin123"})
+
+    def request(self, route):
+        url = self.base_url
+        if route == "GET /":
+            return self.customer.get(url + "/")
+        if route == "GET /packages":
+            return self.customer.get(url + "/packages")
+        if route == "POST /payment":
+            return self.customer.post(f"{url}/payment/{self.rng.randint(1, 5)}",
+                                      data={"phone": self.phone})
+        if route == "POST /callback":
+            return requests.post(url + "/callback",
+                                 json=callback_payload(self.phone, self.rng.choice([1000, 1500, 2000])))
+        if route == "GET /get_token":
+            return self.customer.get(url + "/get_token")
+        if route == "GET /admin/dashboard":
+            return self.admin.get(url + "/admin/dashboard")
+        if route == "GET /admin/usage":
+            return self.admin.get(url + "/admin/usage")
+        raise ValueError(route)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """samples: list of (route, seconds, ok) -> per-route stats dict."""
+    by_route = {}
+    for route, seconds, ok in samples:
+        by_route.setdefault(route, []).append((seconds, ok))
+    by_route["ALL"] = [(seconds, ok) for _, seconds, ok in samples]
+
+    stats = {}
+    for route, values in sorted(by_route.items()):
+        latencies = sorted(s * 1000 for s, _ in values)
+        stats[route] = {
+            "requests": len(values),
+            "errors": sum(1 for _, ok in values if not ok),
+            "rps": round(len(values) / elapsed, 2) if elapsed else 0,
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+        }
+    return stats
+
+
+def run_load(base_url, users, concurrency=16, duration=30, mix=TRAFFIC_MIX, seed=1):
+    routes = [r for r, _ in mix]
+    weights = [w for _, w in mix]
+    samples = []
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        client = Client(base_url, users, rng)
+        local = []
+        while time.time() < deadline:
+            route = rng.choices(routes, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = client.request(route).status_code < 500
+            except requests.RequestException:
+                ok = False
+            local.append((route, time.perf_counter() - started, ok))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(samples, time.time() - started)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def save_results(stats, config, path=None):
+    commit = git_commit()
+    result = {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "config": config,
+        "routes": stats,
+    }
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{commit}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def print_stats(stats):
+    print(f"{'route':<24}{'reqs':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, s in stats.items():
+        print(f"{route:<24}{s['requests']:>8}{s['errors']:>6}{s['rps']:>9}"
+              f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}")
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    print(f"{'route':<24}{'rps':>16}{'p95 ms':>20}{'p99 ms':>20}")
+    for route, n in new["routes"].items():
+        o = old["routes"].get(route)
+        if not o:
+            continue
+
+        def delta(key):
+            change = (n[key] - o[key]) / o[key] * 100 if o[key] else 0
+            return f"{n[key]} ({change:+.0f}%)"
+        print(f"{route:<24}{delta('rps'):>16}{delta('p95_ms'):>20}{delta('p99_ms'):>20}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Portal load driver")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run")
+    run.add_argument("--base-url", default="http://127.0.0.1:8000")
+    run.add_argument("--users", type=int, default=10000, help="number of seeded users")
+    run.add_argument("--concurrency", type=int, default=16)
+    run.add_argument("--duration", type=int, default=30)
+    run.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    run.add_argument("--output")
+
+    cmp_parser = sub.add_parser("compare")
+    cmp_parser.add_argument("old")
+    cmp_parser.add_argument("new")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        compare(args.old, args.new)
+    else:
+        stats = run_load(args.base_url, args.users, args.concurrency, args.duration,
+                         MIXES[args.mix])
+        print_stats(stats)
+        print("💾 Saved", save_results(stats, vars(args), args.output))
@@ -0,0 +1,104 @@
+"""
+Seed a database with realistic User / Payment / Package volumes.
+
+    python -m bench.seed --db sqlite:////tmp/bench.db --users 10000
+
+Every seeded user logs in with password "benchmark". Payments cover
+roughly one renewal per month since signup, with some lapsed users and a
+sprinkling of Pending / Failed rows.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+BENCH_PASSWORD = "benchmark"
+CHUNK = 5000
+
+
+def seeded_phone(i):
+    return f"2547{i:08d}"
+
+
+def seeded_user_phone(i):
+    """The phone as stored on User: half the users type it in local format."""
+    phone = seeded_phone(i)
+    return "0" + phone[3:] if i % 2 else phone
+
+
+def generate(users, months, seed=42, now=None):
+    """Yield ("user", row) and ("payment", row) dicts for bulk insert."""
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    password = generate_password_hash(BENCH_PASSWORD)
+    packages = [("3mbps monthly", 1000), ("6mbps monthly", 1500), ("10mbps monthly", 2000),
+                ("28mbps monthly", 2500), ("35mbps monthly", 3000)]
+
+    for i in range(users):
+        phone = seeded_phone(i)
+        created_at = now - timedelta(days=rng.uniform(0, months * 30))
+        yield "user", {"name": f"Bench User {i}", "phone": seeded_user_phone(i),
+                       "password": password, "created_at": created_at}
+
+        package, amount = rng.choice(packages)
+        churn_after = rng.expovariate(1 / 8)  # months until the user stops paying
+        paid_at = created_at + timedelta(hours=rng.uniform(0, 48))
+        month = 0
+        while paid_at < now and month < churn_after:
+            status = rng.choices(["Completed", "Pending", "Failed"], [0.9, 0.07, 0.03])[0]
+            yield "payment", {
+                "phone": phone, "amount": amount, "status": status,
+                "package": package, "timestamp": paid_at,
+                "expiry_date": paid_at + timedelta(days=30) if status == "Completed" else None,
+                "account_name": f"Bench User {i}",
+            }
+            if status == "Completed":
+                paid_at += timedelta(days=30 + rng.uniform(-2, 5))
+                month += 1
+            else:
+                paid_at += timedelta(minutes=rng.uniform(1, 30))
+
+
+def seed(users, months, seed_value=42):
+    # Import late so DATABASE_URI from the command line is picked up
+    from sqlalchemy import insert
+    from app import app, db, User, Payment
+
+    started = time.time()
+    counts = {"user": 0, "payment": 0}
+    with app.app_context():
+        batches = {"user": [], "payment": []}
+        models = {"user": User, "payment": Payment}
+
+        def flush(kind):
+            if batches[kind]:
+                db.session.execute(insert(models[kind]), batches[kind])
+                counts[kind] += len(batches[kind])
+                batches[kind] = []
+
+        for kind, row in generate(users, months, seed_value):
+            batches[kind].append(row)
+            if len(batches[kind]) >= CHUNK:
+                flush(kind)
+        flush("user")
+        flush("payment")
+        db.session.commit()
+
+    print(f"✅ Seeded {counts['user']} users and {counts['payment']} payments "
+          f"in {time.time() - started:.1f}s")
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed benchmark data")
+    parser.add_argument("--db", default="sqlite:////tmp/isp_bench.db")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URI"] = args.db
+    seed(args.users, args.months, args.seed)
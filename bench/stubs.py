@@ -0,0 +1,210 @@
+"""
+Local stand-ins for Safaricom Daraja and a MikroTik router so the portal
+can be load tested without touching real services.
+
+    python -m bench.stubs --daraja-port 8081 --routeros-port 8728
+
+Point the app at them with MPESA_BASE_URL=http://127.0.0.1:8081,
+MIKROTIK_HOST=127.0.0.1 and MIKROTIK_PORT=8728.
+"""
+import argparse
+import json
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# -----------------------------
+# Daraja (OAuth + STK push)
+# -----------------------------
+class DarajaHandler(BaseHTTPRequestHandler):
+    # Simulated upstream latency in seconds, set by start_daraja()
+    latency = 0.0
+
+    def _reply(self, payload):
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/oauth/v1/generate"):
+            return self._reply({"access_token": "stub-token", "expires_in": "3599"})
+        self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.path.startswith("/mpesa/stkpush/v1/processrequest"):
+            return self._reply({
+                "MerchantRequestID": f"stub-{random.randint(0, 10**9)}",
+                "CheckoutRequestID": f"ws_CO_{random.randint(0, 10**12)}",
+                "ResponseCode": "0",
+                "ResponseDescription": "Success. Request accepted for processing",
+                "CustomerMessage": "Success. Request accepted for processing",
+            })
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_daraja(port, latency=0.0):
+    handler = type("Handler", (DarajaHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# -----------------------------
+# RouterOS API
+# -----------------------------
+def encode_length(length):
+    if length < 0x80:
+        return length.to_bytes(1, "big")
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, "big")
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, "big")
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, "big")
+    return b"\xf0" + length.to_bytes(4, "big")
+
+
+class RouterState:
+    """In-memory /ppp tables shared by every stub connection."""
+
+    def __init__(self, active_sessions=0):
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.tables = {"/ppp/secret": [], "/ppp/profile": [], "/ppp/active": []}
+        self.add("/ppp/profile", {"name": "default"})
+        for i in range(active_sessions):
+            self.add("/ppp/active", {
+                "name": f"2547{i:08d}", "service": "pppoe",
+                "caller-id": f"AA:BB:CC:{i % 256:02X}:{i // 256 % 256:02X}:00",
+                "address": f"10.20.{i // 250 % 250}.{i % 250 + 1}",
+                "uptime": "1d2h3m", "tx-byte": "1048576", "rx-byte": "5242880",
+            })
+
+    def add(self, path, attributes):
+        with self.lock:
+            row = dict(attributes, **{".id": f"*{self.next_id:X}"})
+            self.next_id += 1
+            self.tables.setdefault(path, []).append(row)
+            return row[".id"]
+
+    def handle(self, path, command, attributes, queries):
+        rows = self.tables.get(path, [])
+        if command == "print":
+            return [r for r in rows if all(r.get(k) == v for k, v in queries.items())], {}
+        if command == "add":
+            return [], {"ret": self.add(path, attributes)}
+        with self.lock:
+            target = [r for r in rows if r[".id"] == attributes.get(".id")]
+            if command == "set":
+                for row in target:
+                    row.update(attributes)
+            elif command == "remove":
+                for row in target:
+                    rows.remove(row)
+        return [], {}
+
+
+class RouterOsHandler(socketserver.BaseRequestHandler):
+    state = None
+    latency = 0.0
+
+    def read_bytes(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def read_length(self):
+        first = self.read_bytes(1)[0]
+        if first < 0x80:
+            return first
+        if first < 0xC0:
+            return ((first & 0x3F) << 8) + self.read_bytes(1)[0]
+        if first < 0xE0:
+            return ((first & 0x1F) << 16) + int.from_bytes(self.read_bytes(2), "big")
+        if first < 0xF0:
+            return ((first & 0x0F) << 24) + int.from_bytes(self.read_bytes(3), "big")
+        return int.from_bytes(self.read_bytes(4), "big")
+
+    def read_sentence(self):
+        words = []
+        while True:
+            length = self.read_length()
+            if length == 0:
+                return words
+            words.append(self.read_bytes(length).decode())
+
+    def send_sentence(self, words):
+        data = b"".join(encode_length(len(w.encode())) + w.encode() for w in words)
+        self.request.sendall(data + b"\x00")
+
+    def handle(self):
+        try:
+            while True:
+                words = self.read_sentence()
+                if not words:
+                    continue
+                *path, command = words[0].split("/")
+                path = "/".join(path) or "/"
+                attributes, queries, tag = {}, {}, []
+                for word in words[1:]:
+                    if word.startswith(".tag="):
+                        tag = [word]
+                    elif word.startswith("="):
+                        key, _, value = word[1:].partition("=")
+                        attributes[key] = value
+                    elif word.startswith("?"):
+                        key, _, value = word[1:].partition("=")
+                        queries[key] = value
+
+                if self.latency:
+                    time.sleep(self.latency)
+                rows, done = ([], {}) if command == "login" else \
+                    self.state.handle(path, command, attributes, queries)
+                for row in rows:
+                    self.send_sentence(["!re"] + [f"={k}={v}" for k, v in row.items()] + tag)
+                self.send_sentence(["!done"] + [f"={k}={v}" for k, v in done.items()] + tag)
+        except (ConnectionError, OSError):
+            pass
+
+
+def start_routeros(port, active_sessions=0, latency=0.0):
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    handler = type("Handler", (RouterOsHandler,), {
+        "state": RouterState(active_sessions), "latency": latency,
+    })
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--daraja-port", type=int, default=8081)
+    parser.add_argument("--routeros-port", type=int, default=8728)
+    parser.add_argument("--active-sessions", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds of simulated upstream latency per call")
+    args = parser.parse_args()
+
+    start_daraja(args.daraja_port, args.latency)
+    start_routeros(args.routeros_port, args.active_sessions, args.latency)
+    print(f"✅ Daraja stub on :{args.daraja_port}, RouterOS stub on :{args.routeros_port}")
+    threading.Event().wait()
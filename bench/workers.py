@@ -0,0 +1,66 @@
+"""
+Concurrent checkouts per gunicorn worker, sync vs. threaded workers.
+
+    python -m bench.workers --latency 0.2 --duration 20
+
+Runs the checkout-only mix against a single worker under each worker
+configuration, with the Daraja stub answering after `--latency` seconds,
+and prints checkouts/s and tail latency side by side.
+
+Every checkout waits out at least one stub call, so p50 can't drop below
+`--latency`, and a worker can't exceed threads / latency checkouts/s
+(8 / 0.2 s = 40/s with the defaults). Measured with the defaults and
+--duration 8 on a single vCPU shared with the load driver:
+
+    worker       checkouts/s    p50 ms    p95 ms
+    sync                2.13   3161.44   3485.96
+    gthread            10.96    453.32   1346.33
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+CONFIGS = {
+    "sync": "--worker-class sync --threads 1",
+    "gthread": "--worker-class gthread --threads {threads}",
+    # Only selectable with --configs, as gevent is an optional install
+    "gevent": "--worker-class gevent --worker-connections 200",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gunicorn worker classes")
+    parser.add_argument("--db", default="/tmp/isp_bench.db")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--duration", type=int, default=20)
+    parser.add_argument("--configs", default="sync,gthread",
+                        help="comma-separated; 'gevent' also works if gevent is installed")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.configs.split(","):
+        output = os.path.join(tempfile.gettempdir(), f"bench-workers-{name}.json")
+        subprocess.run([
+            sys.executable, "-m", "bench.run",
+            "--db", args.db, "--users", str(args.users),
+            "--workers", "1", "--gunicorn-args", CONFIGS[name].format(threads=args.threads),
+            "--mix", "checkout", "--latency", str(args.latency),
+            "--concurrency", str(args.concurrency), "--duration", str(args.duration),
+            "--output", output,
+        ], check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            results[name] = json.load(f)["routes"]["POST /payment"]
+
+    print(f"{'worker':<10}{'checkouts/s':>14}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for name, s in results.items():
+        print(f"{name:<10}{s['rps']:>14}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# Gunicorn settings, picked up automatically by `gunicorn app:app`.
+#
+# Most request time is spent waiting on Daraja, MikroTik or the database,
+# so each worker runs a pool of threads instead of handling one request at
+# a time. Concurrency = workers * threads.
+#
+#   GUNICORN_WORKER_CLASS=sync     one request per worker (old behaviour)
+#   GUNICORN_WORKER_CLASS=gthread  thread pool per worker (default)
+#   GUNICORN_WORKER_CLASS=gevent   greenlets; needs `pip install gevent`
+import os
+
+bind = "0.0.0.0:" + os.environ.get("PORT", "8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 200))
+
+# Upstream calls have their own timeouts (see mpesa_utils.REQUEST_TIMEOUT),
+# so a worker stuck longer than this is genuinely hung.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+# gthread parks idle keep-alive sockets and only serves them once a thread
+# frees up; with more clients than threads they time out mid-queue and the
+# client sees a dropped connection. The proxy in front keeps its own pool.
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 0))
+
+
+# Workers only run per-process jobs (warming their router cache). The
+# maintenance jobs hold database locks for a while, so they belong in a
+# separate `flask run-scheduler` process. Where that isn't possible,
+# SCHEDULER_WEB_JOBS=all runs them in the workers too; per-job locks in the
+# database still make sure each run happens in only one of them.
+# SCHEDULER_ENABLED=0 turns the scheduler off in workers altogether.
+def post_worker_init(worker):
+    if os.environ.get("SCHEDULER_ENABLED", "1") == "1":
+        from app import scheduler
+        scheduler.start(exclusive_jobs=os.environ.get("SCHEDULER_WEB_JOBS") == "all")
@@ -1,18 +1,57 @@
 import requests
 import datetime
 import base64
+import os
+import threading
+import time
 from requests.auth import HTTPBasicAuth
 
+# Override to point at a sandbox or a local stub (see bench/stubs.py)
+API_BASE_URL = os.environ.get("MPESA_BASE_URL", "https://api.safaricom.co.ke")
+# (connect, read) seconds, so a slow Daraja can't pin a worker thread forever
+REQUEST_TIMEOUT = (5, 30)
+
+# One pooled HTTP session per process: reuses TLS connections to Daraja
+http = requests.Session()
+
+# Daraja tokens live ~1 hour; reuse them instead of an OAuth round trip per push
+_token_cache = {}
+_token_lock = threading.Lock()
+
 def get_access_token(consumer_key, consumer_secret):
     """
-    Generate OAuth token from Safaricom Daraja API
+    Generate OAuth token from Safaricom Daraja API (cached until shortly
+    before it expires)
     """
-    url = "https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
+    cached = _token_cache.get(consumer_key)
+    if cached and cached["expires_at"] > time.time():
+        return cached["token"]
+
+    with _token_lock:
+        # Another thread may have refreshed it while we waited
+        cached = _token_cache.get(consumer_key)
+        if cached and cached["expires_at"] > time.time():
+            return cached["token"]
+        return _fetch_access_token(consumer_key, consumer_secret)
+
+
+def _fetch_access_token(consumer_key, consumer_secret):
+    url = f"{API_BASE_URL}/oauth/v1/generate?grant_type=client_credentials"
 
     try:
-        response = requests.get(url, auth=HTTPBasicAuth(consumer_key, consumer_secret))
+        response = http.get(url, auth=HTTPBasicAuth(consumer_key, consumer_secret),
+                            timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
-            token = response.json().get('access_token')
+            data = response.json()
+            token = data.get('access_token')
+            if not token:
+                print("❌ Token response had no access_token:", response.text)
+                return None
+            expires_in = int(data.get('expires_in', 3599))
+            _token_cache[consumer_key] = {
+                "token": token,
+                "expires_at": time.time() + expires_in - 60,
+            }
             print("✅ Access Token generated successfully.")
             return token
         else:
@@ -50,7 +89,7 @@ def initiate_stk_push(
     data_to_encode = business_short_code + passkey + timestamp
     encoded_password = base64.b64encode(data_to_encode.encode()).decode('utf-8')
 
-    stk_url = "https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
+    stk_url = f"{API_BASE_URL}/mpesa/stkpush/v1/processrequest"
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json"
@@ -74,8 +113,11 @@ def initiate_stk_push(
     }
 
     try:
-        response = requests.post(stk_url, json=payload, headers=headers)
+        response = http.post(stk_url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
         print("📤 STK Push Request Sent. Payload:", payload)
+        if response.status_code == 401:
+            # Token revoked or expired early: fetch a fresh one next time
+            _token_cache.pop(consumer_key, None)
         return response.json()
     except Exception as e:
         print("❌ Error during STK push:", str(e))
@@ -0,0 +1,178 @@
+import re
+from datetime import datetime
+
+# Package names look like "10mbps monthly"; the number drives the profile
+SPEED_PATTERN = re.compile(r'(\d+)\s*mbps', re.IGNORECASE)
+
+
+def normalize_phone(phone):
+    """
+    Normalise a phone number to the 2547XXXXXXXX form used by M-Pesa
+    """
+    phone = (phone or "").strip()
+    if phone.startswith("0"):
+        return "254" + phone[1:]
+    if phone.startswith("+254"):
+        return phone[1:]
+    return phone
+
+
+def speed_profile(package_name):
+    """
+    Map a package name to a (profile_name, rate_limit) pair, or
+    (None, None) when the name carries no speed.
+    """
+    match = SPEED_PATTERN.search(package_name or "")
+    if not match:
+        return None, None
+    mbps = match.group(1)
+    return f"{mbps}mbps", f"{mbps}M/{mbps}M"
+
+
+def desired_secrets(subscriptions, package_names_by_amount=None, now=None):
+    """
+    Build the desired /ppp/secret state from the latest completed payment
+    of every subscriber.
+
+    `subscriptions` yields (phone, package, amount, expiry_date, account_name)
+    rows. Rows whose package can't be resolved to a speed, by name or by an
+    exact package amount, are ignored rather than granted a default profile.
+    Returns {secret_name: {"profile", "rate_limit", "disabled", "comment"}}.
+    """
+    now = now or datetime.utcnow()
+    package_names_by_amount = package_names_by_amount or {}
+    desired = {}
+
+    for phone, package, amount, expiry_date, account_name in subscriptions:
+        name = normalize_phone(phone)
+        if not name:
+            continue
+        # Payments recorded by the callback fallback carry no package name
+        package = package or package_names_by_amount.get(amount)
+        profile, rate_limit = speed_profile(package)
+        if profile is None:
+            continue
+        active = expiry_date is not None and expiry_date > now
+
+        current = desired.get(name)
+        if current and current["expiry_date"] and (
+                not expiry_date or current["expiry_date"] >= expiry_date):
+            continue
+
+        desired[name] = {
+            "profile": profile,
+            "rate_limit": rate_limit,
+            "disabled": "no" if active else "yes",
+            "comment": (account_name or "")[:100],
+            "expiry_date": expiry_date,
+        }
+    return desired
+
+
+def _is_disabled(row):
+    return str(row.get("disabled", "false")).lower() in ("true", "yes")
+
+
+def diff_secrets(desired, current_secrets):
+    """
+    Compare desired state with rows from /ppp/secret print.
+
+    Returns (to_add, to_update): names missing on the router, and
+    (id, changes) pairs for existing secrets whose profile or disabled
+    flag differ. Secrets we don't know about are left untouched.
+    """
+    existing = {row.get("name"): row for row in current_secrets}
+    to_add = []
+    to_update = []
+
+    for name, wanted in desired.items():
+        row = existing.get(name)
+        if row is None:
+            # Nothing to create for lapsed subscribers without a secret
+            if wanted["disabled"] == "no":
+                to_add.append(name)
+            continue
+
+        changes = {}
+        if row.get("profile") != wanted["profile"]:
+            changes["profile"] = wanted["profile"]
+        if _is_disabled(row) != (wanted["disabled"] == "yes"):
+            changes["disabled"] = wanted["disabled"]
+        if changes:
+            to_update.append((row["id"], changes))
+
+    return to_add, to_update
+
+
+def _run_pipelined(resource, command, argument_list):
+    """
+    Send every command before reading any reply so a batch costs one
+    round trip instead of one per item.
+    """
+    promises = [resource.call_async(command, args) for args in argument_list]
+    errors = []
+    for promise in promises:
+        try:
+            promise.get()
+        except Exception as e:
+            errors.append(str(e))
+    return errors
+
+
+def sync_secrets(api, desired, default_password=None, names=None):
+    """
+    Apply `desired` to the router over an already-open API connection.
+
+    When `names` is given only those secrets are fetched (incremental
+    sync); otherwise the whole /ppp/secret table is read once (full sync).
+    Missing secrets are only created when `default_password` is set.
+    """
+    secrets = api.get_resource('/ppp/secret')
+    profiles = api.get_resource('/ppp/profile')
+
+    if names is None:
+        current = secrets.get()
+    else:
+        current = []
+        for promise in [secrets.get_async(name=n) for n in names]:
+            current.extend(promise.get())
+
+    # Make sure every speed profile we are about to assign exists
+    existing_profiles = {p.get("name") for p in profiles.get()}
+    missing_profiles = {}
+    for wanted in desired.values():
+        if wanted["profile"] not in existing_profiles:
+            missing_profiles[wanted["profile"]] = wanted["rate_limit"]
+    errors = _run_pipelined(profiles, 'add', [
+        {"name": name, "rate-limit": rate_limit}
+        for name, rate_limit in missing_profiles.items()
+    ])
+
+    to_add, to_update = diff_secrets(desired, current)
+
+    skipped = 0
+    if default_password:
+        errors += _run_pipelined(secrets, 'add', [
+            {
+                "name": name,
+                "password": default_password,
+                "service": "pppoe",
+                "profile": desired[name]["profile"],
+                "comment": desired[name]["comment"],
+            }
+            for name in to_add
+        ])
+    else:
+        skipped = len(to_add)
+
+    errors += _run_pipelined(secrets, 'set', [
+        dict(changes, id=secret_id) for secret_id, changes in to_update
+    ])
+
+    return {
+        "profiles_added": len(missing_profiles),
+        "added": len(to_add) - skipped,
+        "updated": len(to_update),
+        "skipped": skipped,
+        "errors": errors,
+    }
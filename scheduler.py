@@ -0,0 +1,173 @@
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+
+class Scheduler:
+    """
+    Tiny interval scheduler that runs inside the app's own processes.
+
+    Exclusive jobs are claimed through a row in `state_model`, so with
+    several processes polling each run happens in exactly one of them.
+    Non-exclusive jobs (e.g. warming a per-process cache) run everywhere.
+    Runs are recorded in `run_model`; non-exclusive jobs only record
+    failures, as they fire in every process.
+    """
+
+    def __init__(self, app, db, state_model, run_model, poll_interval=5):
+        self.app = app
+        self.db = db
+        self.state_model = state_model
+        self.run_model = run_model
+        self.poll_interval = poll_interval
+        self.jobs = {}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._local_next_run = {}
+        # Earliest time each exclusive job can next be claimed, as last seen
+        # in the database; saves a write per job per poll while nothing is due
+        self._next_due = {}
+        self._state_rows_ready = False
+        self._thread = None
+
+    def job(self, name, every, exclusive=True, timeout=600):
+        """Register a function to run every `every` seconds."""
+        def decorator(func):
+            self.jobs[name] = {
+                "func": func, "every": every,
+                "exclusive": exclusive, "timeout": timeout,
+            }
+            return func
+        return decorator
+
+    # -----------------------------
+    # Locking
+    # -----------------------------
+    def _ensure_state_rows(self):
+        if self._state_rows_ready:
+            return
+        Model = self.state_model
+        existing = {name for (name,) in self.db.session.query(Model.name)}
+        for name, job in self.jobs.items():
+            if job["exclusive"] and name not in existing:
+                self.db.session.add(Model(name=name, next_run_at=datetime.utcnow()))
+                try:
+                    self.db.session.commit()
+                except IntegrityError:
+                    # Another worker inserted it first
+                    self.db.session.rollback()
+        self._state_rows_ready = True
+
+    def _claim(self, name, force=False):
+        """Atomically take the job's lock if it is due and not held."""
+        Model = self.state_model
+        now = datetime.utcnow()
+        if not force:
+            # Plain read first, so idle polls never take a write lock
+            next_run_at, locked_until = self.db.session.query(
+                Model.next_run_at, Model.locked_until).filter(Model.name == name).one()
+            not_before = max(next_run_at, locked_until or next_run_at)
+            if not_before > now:
+                self._next_due[name] = not_before
+                self.db.session.rollback()
+                return False
+
+        query = Model.query.filter(
+            Model.name == name,
+            (Model.locked_until.is_(None)) | (Model.locked_until < now),
+        )
+        if not force:
+            query = query.filter(Model.next_run_at <= now)
+        claimed = query.update({
+            "locked_by": self.owner,
+            "locked_until": now + timedelta(seconds=self.jobs[name]["timeout"]),
+        }, synchronize_session=False)
+        self.db.session.commit()
+        return claimed == 1
+
+    def _release(self, name, started_at):
+        self.state_model.query.filter_by(name=name, locked_by=self.owner).update({
+            "locked_by": None,
+            "locked_until": None,
+            "last_run_at": started_at,
+            "next_run_at": started_at + timedelta(seconds=self.jobs[name]["every"]),
+        }, synchronize_session=False)
+        self.db.session.commit()
+        self._next_due[name] = started_at + timedelta(seconds=self.jobs[name]["every"])
+
+    # -----------------------------
+    # Running
+    # -----------------------------
+    def _execute(self, name, record_ok=True):
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        status, detail = "ok", None
+        try:
+            result = self.jobs[name]["func"]()
+            detail = None if result is None else str(result)[:500]
+        except Exception:
+            self.db.session.rollback()
+            status, detail = "error", traceback.format_exc()[-500:]
+            print(f"❌ Job {name} failed:", detail)
+
+        if status == "ok" and not record_ok:
+            return started_at, status
+        self.db.session.add(self.run_model(
+            job=name, owner=self.owner, status=status, detail=detail,
+            started_at=started_at,
+            duration_ms=int((time.perf_counter() - started) * 1000),
+        ))
+        self.db.session.commit()
+        return started_at, status
+
+    def run_job(self, name, force=False):
+        """Run one job now if we can claim it. Returns the status or None."""
+        job = self.jobs[name]
+        with self.app.app_context():
+            if not job["exclusive"]:
+                started_at, status = self._execute(name, record_ok=False)
+                self._local_next_run[name] = time.time() + job["every"]
+                return status
+
+            if not force and self._next_due.get(name, datetime.min) > datetime.utcnow():
+                return None
+            self._ensure_state_rows()
+            if not self._claim(name, force):
+                return None
+            started_at, status = self._execute(name)
+            self._release(name, started_at)
+            return status
+
+    def run_pending(self, local_jobs=True, exclusive_jobs=True):
+        """
+        Run whatever is due. `local_jobs=False` skips non-exclusive jobs,
+        for processes that don't serve requests; `exclusive_jobs=False`
+        skips the maintenance jobs, for processes that do.
+        """
+        for name, job in self.jobs.items():
+            if job["exclusive"] and not exclusive_jobs:
+                continue
+            if not job["exclusive"] and (
+                    not local_jobs or self._local_next_run.get(name, 0) > time.time()):
+                continue
+            try:
+                self.run_job(name)
+            except Exception as e:
+                print(f"⚠️ Scheduler could not run {name}:", e)
+
+    def run_forever(self, local_jobs=True, exclusive_jobs=True):
+        while True:
+            self.run_pending(local_jobs, exclusive_jobs)
+            time.sleep(self.poll_interval)
+
+    def start(self, exclusive_jobs=True):
+        """Run the loop in a daemon thread (once per process)."""
+        if self._thread is None:
+            self.owner = f"{socket.gethostname()}:{os.getpid()}"
+            self._thread = threading.Thread(
+                target=self.run_forever, kwargs={"exclusive_jobs": exclusive_jobs}, daemon=True)
+            self._thread.start()
@@ -0,0 +1,5 @@
+import os
+
+# app.py reads these at import time; keep tests on a throwaway database
+os.environ["DATABASE_URI"] = "sqlite:///:memory:"
+os.environ.setdefault("SECRET_KEY", "test")
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as portal
+from analytics import compute_cohorts, compute_renewals, month_label
+
+
+@pytest.fixture
+def db():
+    with portal.app.app_context():
+        portal.db.drop_all()
+        portal.db.create_all()
+        yield portal.db
+        portal.db.session.remove()
+
+
+def _pay(phone, paid_at, status="Completed"):
+    return portal.Payment(
+        phone=phone, amount=1000, status=status, package="3mbps monthly",
+        timestamp=paid_at, expiry_date=paid_at + timedelta(days=30),
+    )
+
+
+@pytest.fixture
+def subscriber(db):
+    # Registered as typed; M-Pesa reports the same line as 2547...
+    db.session.add(portal.User(name="A", phone="0700000001", password="x",
+                               created_at=datetime(2026, 1, 20)))
+    db.session.add_all([
+        _pay("254700000001", datetime(2026, 1, 20)),  # due 02-19
+        _pay("254700000001", datetime(2026, 2, 19)),  # due 03-21, renewed on time
+        _pay("254700000001", datetime(2026, 4, 5)),   # 15 days late, due 05-05
+        _pay("254700000001", datetime(2026, 5, 1), status="Pending"),
+    ])
+    db.session.commit()
+    return db
+
+
+def test_cohorts_join_local_phone_format(subscriber):
+    cohorts = compute_cohorts(subscriber.session, portal.User, portal.Payment)
+    assert cohorts == [{"cohort": "2026-01", "size": 1, "retained": [1, 1, 0, 1, 0, 0]}]
+
+
+def test_renewals_follow_expiry_not_calendar_month(subscriber):
+    renewals = compute_renewals(subscriber.session, portal.Payment, now=datetime(2026, 6, 1))
+    assert [(r["month"], r["active"], r["renewed"]) for r in renewals] == [
+        ("2026-02", 1, 1),  # 30-day cycle crossing into February
+        ("2026-03", 1, 0),  # paid again after the 7-day grace: churn
+        ("2026-05", 1, 0),
+    ]
+    assert renewals[0]["churn_rate"] == 0
+    assert renewals[1]["churn_rate"] == 100
+
+
+def test_renewals_wait_for_grace_window(subscriber):
+    renewals = compute_renewals(subscriber.session, portal.Payment, now=datetime(2026, 5, 10))
+    assert [r["month"] for r in renewals] == ["2026-02", "2026-03"]
+
+
+def test_load_cohorts_leaves_future_periods_blank(db):
+    now = datetime.utcnow()
+    cohort = month_label(now.year * 12 + now.month - 1 - 2)
+    db.session.add_all([
+        portal.CohortStat(cohort=cohort, size=4, period=period, retained=retained,
+                          computed_at=now)
+        for period, retained in enumerate([4, 2, 1, 0, 0, 0])
+    ])
+    db.session.commit()
+
+    assert portal.load_cohorts() == [
+        {"cohort": cohort, "size": 4, "rates": [100.0, 50.0, None, None, None, None]},
+    ]
@@ -0,0 +1,55 @@
+import mpesa_utils
+
+
+class _Response:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+        self.text = str(data)
+
+    def json(self):
+        return self.data
+
+
+class _Daraja:
+    """Hands out tokens from `tokens` and answers pushes with `push_status`."""
+
+    def __init__(self, tokens, push_status=200):
+        self.tokens = list(tokens)
+        self.push_status = push_status
+        self.token_requests = 0
+
+    def get(self, url, **kwargs):
+        self.token_requests += 1
+        return _Response(200, {"access_token": self.tokens.pop(0), "expires_in": "3599"})
+
+    def post(self, url, **kwargs):
+        return _Response(self.push_status, {"ResponseCode": "0"})
+
+
+def _push():
+    return mpesa_utils.initiate_stk_push(
+        "key", "secret", "174379", "passkey", 1000, "254700000001", "https://example.com/cb")
+
+
+def test_empty_token_is_not_cached(monkeypatch):
+    daraja = _Daraja(["", "tok"])
+    monkeypatch.setattr(mpesa_utils, "http", daraja)
+    monkeypatch.setattr(mpesa_utils, "_token_cache", {})
+
+    assert _push() == {"error": "Failed to get token"}
+    assert _push() == {"ResponseCode": "0"}
+    assert daraja.token_requests == 2
+
+
+def test_rejected_token_is_evicted(monkeypatch):
+    daraja = _Daraja(["stale", "fresh"], push_status=401)
+    monkeypatch.setattr(mpesa_utils, "http", daraja)
+    monkeypatch.setattr(mpesa_utils, "_token_cache", {})
+
+    _push()
+    assert "key" not in mpesa_utils._token_cache
+    daraja.push_status = 200
+    _push()
+    assert mpesa_utils._token_cache["key"]["token"] == "fresh"
+    assert daraja.token_requests == 2
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+
+import app as portal
+from bench.stubs import RouterState
+from provisioning import desired_secrets, diff_secrets, sync_secrets
+
+NOW = datetime(2026, 3, 1)
+
+
+class _Promise:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class _Resource:
+    """Minimal routeros_api resource backed by the benchmark RouterState."""
+
+    def __init__(self, state, path):
+        self.state = state
+        self.path = path
+
+    def _call(self, command, arguments=None, queries=None):
+        arguments = {('.id' if k == 'id' else k): v for k, v in (arguments or {}).items()}
+        rows, _ = self.state.handle(self.path, command, arguments, queries or {})
+        # routeros_api strips the leading dot from .id
+        return [{('id' if k == '.id' else k): v for k, v in row.items()} for row in rows]
+
+    def get(self, **queries):
+        return self._call('print', queries=queries)
+
+    def get_async(self, **queries):
+        return _Promise(self.get(**queries))
+
+    def call_async(self, command, arguments):
+        return _Promise(self._call(command, arguments))
+
+
+class _Api:
+    def __init__(self, state):
+        self.state = state
+
+    def get_resource(self, path):
+        return _Resource(self.state, path)
+
+
+def test_latest_expiry_wins():
+    desired = desired_secrets([
+        ("254700000001", "3mbps monthly", 1000, NOW + timedelta(days=5), "A"),
+        ("0700000001", "10mbps monthly", 2000, NOW + timedelta(days=20), "A"),
+        ("254700000001", "6mbps monthly", 1500, NOW - timedelta(days=40), "A"),
+    ], now=NOW)
+
+    assert list(desired) == ["254700000001"]
+    assert desired["254700000001"]["profile"] == "10mbps"
+    assert desired["254700000001"]["disabled"] == "no"
+
+
+def test_package_less_row_resolved_by_amount():
+    desired = desired_secrets(
+        [("254700000002", None, 1500, NOW + timedelta(days=1), None)],
+        package_names_by_amount={1500: "6mbps monthly"}, now=NOW,
+    )
+    assert desired["254700000002"]["profile"] == "6mbps"
+    assert desired["254700000002"]["rate_limit"] == "6M/6M"
+
+
+def test_unresolvable_package_is_ignored():
+    desired = desired_secrets([
+        ("254700000006", None, 1234, NOW + timedelta(days=30), None),
+        ("254700000007", "Gold plan", 1000, NOW + timedelta(days=30), None),
+    ], package_names_by_amount={1000: "3mbps monthly"}, now=NOW)
+    assert desired == {}
+
+
+def test_unmatched_callback_does_not_provision(monkeypatch):
+    queued = []
+    monkeypatch.setattr(portal, "enqueue_provisioning", queued.extend)
+    with portal.app.app_context():
+        portal.db.drop_all()
+        portal.db.create_all()
+        portal.app.test_client().post('/callback', json={"Body": {"stkCallback": {
+            "ResultCode": 0,
+            "CallbackMetadata": {"Item": [
+                {"Name": "Amount", "Value": 1000},
+                {"Name": "PhoneNumber", "Value": 254700000099},
+            ]},
+        }}})
+        assert portal.Payment.query.count() == 1
+    assert queued == []
+
+
+def test_lapsed_without_secret_is_not_added():
+    desired = desired_secrets(
+        [("254700000003", "3mbps monthly", 1000, NOW - timedelta(days=1), None)], now=NOW)
+    assert diff_secrets(desired, []) == ([], [])
+
+
+def test_disabled_flag_formats():
+    desired = desired_secrets([
+        ("254700000004", "3mbps monthly", 1000, NOW + timedelta(days=1), None),
+        ("254700000005", "3mbps monthly", 1000, NOW - timedelta(days=1), None),
+    ], now=NOW)
+
+    # Already in the wanted state, whichever spelling the router uses
+    for enabled, disabled in (("false", "true"), ("no", "yes")):
+        current = [
+            {"id": "*1", "name": "254700000004", "profile": "3mbps", "disabled": enabled},
+            {"id": "*2", "name": "254700000005", "profile": "3mbps", "disabled": disabled},
+        ]
+        assert diff_secrets(desired, current) == ([], [])
+
+    current = [
+        {"id": "*1", "name": "254700000004", "profile": "3mbps", "disabled": "true"},
+        {"id": "*2", "name": "254700000005", "profile": "3mbps", "disabled": "no"},
+    ]
+    assert diff_secrets(desired, current) == ([], [
+        ("*1", {"disabled": "no"}),
+        ("*2", {"disabled": "yes"}),
+    ])
+
+
+def test_sync_secrets_against_stub_router():
+    state = RouterState()
+    api = _Api(state)
+    state.add("/ppp/secret", {"name": "254700000010", "profile": "default", "disabled": "true"})
+    state.add("/ppp/secret", {"name": "unmanaged", "profile": "default", "disabled": "false"})
+    desired = desired_secrets([
+        ("254700000010", "10mbps monthly", 2000, NOW + timedelta(days=3), None),
+        ("254700000011", "3mbps monthly", 1000, NOW + timedelta(days=3), None),
+        ("254700000012", "3mbps monthly", 1000, NOW - timedelta(days=3), None),
+    ], now=NOW)
+
+    # Without a default password missing secrets are skipped, not created
+    result = sync_secrets(api, desired)
+    assert (result["added"], result["updated"], result["skipped"]) == (0, 1, 1)
+
+    result = sync_secrets(api, desired, default_password="pw")
+    assert (result["added"], result["updated"], result["skipped"]) == (1, 0, 0)
+    assert result["profiles_added"] == 0
+    assert result["errors"] == []
+
+    # A second full sync is a no-op
+    result = sync_secrets(api, desired, default_password="pw")
+    assert (result["added"], result["updated"], result["skipped"]) == (0, 0, 0)
+
+    secrets = {row["name"]: row for row in state.tables["/ppp/secret"]}
+    assert secrets["254700000010"]["profile"] == "10mbps"
+    assert secrets["254700000010"]["disabled"] == "no"
+    assert secrets["254700000011"]["profile"] == "3mbps"
+    assert secrets["unmanaged"]["disabled"] == "false"
+    assert "254700000012" not in secrets